@@ -1,168 +1,46 @@
-from flask import Flask, Response, jsonify
+from flask import Flask, Response, jsonify, request, send_file
 from flask_cors import CORS
-import cv2
-import threading
-import json
 import time
 import os
-from ppe_detection import load_model, process_frame
-import numpy as np
+from detection_sessions import SessionManager, parse_session_config
+from clip_recorder import list_clips, DEFAULT_CLIPS_DIR
+
+# cv2, numpy and the model stack are imported lazily so the server starts quickly
 
 app = Flask(__name__)
 CORS(app)  # Allow cross-origin requests
 
-# Global variables
-camera = None
-output_frame = None
-lock = threading.Lock()
-detection_active = False
-detection_results = []
-violation_count = 0
-helmet_count = 0
-vest_count = 0
+# Debug mode (and with it the auto-reloader) when started with `python api_server.py`
+DEBUG = True
 
-def init_camera():
-    """Initialize the camera"""
-    global camera
-    try:
-        # Try different camera indices (0, 1, 2) in sequence
-        for camera_idx in [0, 1, 2]:
-            print(f"Attempting to open camera at index {camera_idx}")
-            camera = cv2.VideoCapture(camera_idx)
-            if camera.isOpened():
-                # Successfully opened camera
-                print(f"Successfully opened camera at index {camera_idx}")
-                
-                # Set optimal properties
-                camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-                camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-                camera.set(cv2.CAP_PROP_FPS, 30)
-                return True
-        
-        print("Error: Could not open any camera")
-        return False
-    except Exception as e:
-        print(f"Error initializing camera: {e}")
-        return False
+# Detection sessions share one model and inference scheduler
+session_manager = SessionManager()
 
-def detection_thread():
-    """Background thread for PPE detection"""
-    global camera, output_frame, lock, detection_active
-    global detection_results, violation_count, helmet_count, vest_count
-    
-    # Load the model
-    model = load_model()
-    if model is None:
-        print("Failed to load model")
-        detection_active = False
-        return
-    
-    # Reset counters
-    violation_count = 0
-    helmet_count = 0
-    vest_count = 0
-    detection_results = []
-    
-    frame_failure_count = 0
-    max_failures = 10
+def should_preload():
+    """Decide whether this process should load the model in the background"""
+    if os.environ.get("PPE_PRELOAD", "1") == "0":
+        return False
     
-    # Continue until detection is stopped
-    while detection_active:
-        try:
-            if camera is None or not camera.isOpened():
-                print("Camera disconnected, attempting to reconnect...")
-                if not init_camera():
-                    print("Failed to reconnect camera, stopping detection")
-                    detection_active = False
-                    break
-            
-            success, frame = camera.read()
-            if not success or frame is None or frame.size == 0:
-                frame_failure_count += 1
-                print(f"Error reading frame (failure {frame_failure_count}/{max_failures})")
-                
-                if frame_failure_count >= max_failures:
-                    print("Too many frame reading failures, attempting to reinitialize camera")
-                    if camera is not None:
-                        camera.release()
-                    if not init_camera():
-                        print("Failed to reinitialize camera, stopping detection")
-                        detection_active = False
-                        break
-                    frame_failure_count = 0
-                
-                time.sleep(0.5)  # Wait a bit before retrying
-                continue
-            
-            # Reset failure counter on successful frame read
-            frame_failure_count = 0
-            
-            # Process frame with the model
-            fps_start = cv2.getTickCount()
-            processed_frame = process_frame(frame, model, fps_start)
-            
-            if processed_frame is not None:
-                # Extract detection results from the model
-                results = extract_detection_results(model, frame)
-                
-                # Update counters based on detection
-                update_counters(results)
-                
-                # Lock the frame for thread safety
-                with lock:
-                    output_frame = processed_frame.copy()
-                    detection_results.append(results)
-                    # Keep only the last 50 results
-                    if len(detection_results) > 50:
-                        detection_results = detection_results[-50:]
-            else:
-                print("Failed to process frame, skipping")
-            
-        except Exception as e:
-            print(f"Error in detection thread: {e}")
-        
-        # Sleep a bit to avoid excessive CPU usage
-        time.sleep(0.03)
+    # With the auto-reloader the server runs in a child process; only that one loads the model
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        return True
+    reloader_parent = (
+        (__name__ == "__main__" and DEBUG) or
+        (os.environ.get("FLASK_RUN_FROM_CLI") == "true" and os.environ.get("FLASK_DEBUG") in ("1", "true"))
+    )
+    return not reloader_parent
 
-def extract_detection_results(model, frame):
-    """Extract detection results from the model (mock implementation)"""
-    # In a real implementation, this would extract actual results from the YOLOv8 model
-    # For demo purposes, we're generating mock results
-    results = model(frame, conf=0.25, iou=0.45, verbose=False)
-    
-    detections = []
-    for result in results:
-        boxes = result.boxes
-        for box in boxes:
-            cls = int(box.cls[0])
-            conf = float(box.conf[0])
-            class_name = result.names[cls]
-            
-            detections.append({
-                "type": class_name,
-                "detected": True,  # Since it was detected
-                "confidence": conf
-            })
-    
-    timestamp = time.strftime("%H:%M:%S")
-    return {"timestamp": timestamp, "detections": detections}
+# Load the model in the background so /api/status and /api/ready answer straight away,
+# whether the app runs from `python api_server.py`, `flask run` or a WSGI server
+if should_preload():
+    session_manager.scheduler.preload()
 
-def update_counters(results):
-    """Update detection counters based on results"""
-    global violation_count, helmet_count, vest_count
-    
-    for detection in results.get("detections", []):
-        type_name = detection.get("type", "")
-        if type_name.startswith("NO-") and detection.get("detected", False):
-            violation_count += 1
-        elif (type_name == "Hardhat" or type_name == "helmet") and detection.get("detected", False):
-            helmet_count += 1
-        elif (type_name == "Safety Vest" or type_name == "vest") and detection.get("detected", False):
-            vest_count += 1
+# Session used by the original single-camera endpoints
+DEFAULT_SESSION_ID = "default"
 
-def generate_frames():
+def generate_frames(session_id):
     """Generate frames for video streaming"""
-    global output_frame, lock
+    import cv2
     
     # Create a blank frame with text to use when no real frame is available
     blank_height, blank_width = 480, 640
@@ -170,12 +48,11 @@ def generate_frames():
     
     while True:
         try:
-            # Get the frame with lock protection
-            with lock:
-                if output_frame is None:
-                    current_frame = blank_frame.copy()
-                else:
-                    current_frame = output_frame.copy()
+            # Look the session up each time so the stream survives restarts
+            session = session_manager.get(session_id)
+            current_frame = session.get_output_frame() if session is not None else None
+            if current_frame is None:
+                current_frame = blank_frame.copy()
             
             # Encode the frame in JPEG format
             (flag, encoded_image) = cv2.imencode(".jpg", current_frame)
@@ -197,6 +74,9 @@ def generate_frames():
 
 def create_blank_frame(width, height, message="No signal"):
     """Create a blank frame with message text"""
+    import cv2
+    import numpy as np
+    
     blank_frame = np.zeros((height, width, 3), dtype=np.uint8)
     
     # Add text in the center
@@ -217,69 +97,169 @@ def index():
 @app.route("/api/start", methods=["POST"])
 def start_detection():
     """Start PPE detection"""
-    global detection_active, camera
-    
-    if detection_active:
+    session = session_manager.get(DEFAULT_SESSION_ID)
+    if session is not None and session.active:
         return jsonify({"success": False, "message": "Detection already running"})
     
-    # Initialize camera if not already initialized
-    if camera is None or not camera.isOpened():
-        success = init_camera()
-        if not success:
-            return jsonify({"success": False, "message": "Failed to initialize camera"})
+    # Replace a default session that stopped on its own
+    if session is not None:
+        session_manager.delete(DEFAULT_SESSION_ID)
     
-    # Start detection thread
-    detection_active = True
-    threading.Thread(target=detection_thread, daemon=True).start()
+    try:
+        config = parse_session_config(request.get_json(silent=True))
+        session_manager.create(config, session_id=DEFAULT_SESSION_ID)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)})
     
     return jsonify({"success": True, "message": "Detection started"})
 
 @app.route("/api/stop", methods=["POST"])
 def stop_detection():
     """Stop PPE detection"""
-    global detection_active, camera
-    
-    if not detection_active:
+    if not session_manager.delete(DEFAULT_SESSION_ID):
         return jsonify({"success": False, "message": "Detection not running"})
     
-    # Stop detection thread
-    detection_active = False
-    
-    # Release camera
-    if camera is not None and camera.isOpened():
-        camera.release()
-        camera = None
-    
     return jsonify({"success": True, "message": "Detection stopped"})
 
 @app.route("/api/status")
 def get_status():
     """Get detection status and counters"""
-    global detection_active, violation_count, helmet_count, vest_count
+    session = session_manager.get(DEFAULT_SESSION_ID)
+    status = session.to_dict() if session is not None else {}
     
     return jsonify({
-        "active": detection_active,
-        "violations": violation_count,
-        "helmets": helmet_count,
-        "vests": vest_count
+        "active": status.get("active", False),
+        "violations": status.get("violations", 0),
+        "helmets": status.get("helmets", 0),
+        "vests": status.get("vests", 0),
+        "sessions": len(session_manager.list()),
+        "model": session_manager.scheduler.model_status
     })
 
+@app.route("/api/ready")
+def get_ready():
+    """Readiness check: 200 once the model is loaded, 503 otherwise (no side effects)"""
+    scheduler = session_manager.scheduler
+    ready = scheduler.model_status == "ready"
+    return jsonify({"ready": ready, "model": scheduler.model_status}), 200 if ready else 503
+
+@app.route("/api/model/load", methods=["POST"])
+def load_model_route():
+    """Retry loading the model, e.g. after replacing a broken best.pt"""
+    scheduler = session_manager.scheduler
+    if scheduler.model_status not in ("not_loaded", "failed"):
+        return jsonify({"success": False, "message": f"Model is {scheduler.model_status}"})
+    
+    scheduler.preload()
+    return jsonify({"success": True, "message": "Model loading started"})
+
 @app.route("/api/results")
 def get_results():
     """Get recent detection results"""
-    global detection_results
+    session = session_manager.get(DEFAULT_SESSION_ID)
     
-    return jsonify({"results": detection_results})
+    return jsonify({"results": session.get_results() if session is not None else []})
 
 @app.route("/video_feed")
 def video_feed():
     """Video streaming route"""
-    return Response(generate_frames(),
+    return Response(generate_frames(DEFAULT_SESSION_ID),
                     mimetype="multipart/x-mixed-replace; boundary=frame")
 
+@app.route("/api/sessions", methods=["GET"])
+def list_sessions():
+    """List all detection sessions"""
+    return jsonify({"sessions": [session.to_dict() for session in session_manager.list()]})
+
+@app.route("/api/sessions", methods=["POST"])
+def create_session():
+    """Create and start a detection session"""
+    data = request.get_json(silent=True) or {}
+    try:
+        config = parse_session_config(data)
+        session = session_manager.create(config)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    
+    return jsonify({"success": True, "session": session.to_dict()}), 201
+
+@app.route("/api/sessions/<session_id>", methods=["GET"])
+def get_session(session_id):
+    """Get a session's settings and counters"""
+    session = session_manager.get(session_id)
+    if session is None:
+        return jsonify({"success": False, "message": "Session not found"}), 404
+    
+    return jsonify({"success": True, "session": session.to_dict()})
+
+@app.route("/api/sessions/<session_id>", methods=["PATCH"])
+def update_session(session_id):
+    """Change a running session's thresholds, class filter, FPS cap or priority"""
+    session = session_manager.get(session_id)
+    if session is None:
+        return jsonify({"success": False, "message": "Session not found"}), 404
+    
+    data = request.get_json(silent=True) or {}
+    for key in ("id", "source", "record", "pre_roll", "post_roll"):
+        if key in data:
+            return jsonify({"success": False, "message": f"{key} cannot be changed, create a new session"}), 400
+    try:
+        session_manager.update(session, parse_session_config(data, partial=True))
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    
+    return jsonify({"success": True, "session": session.to_dict()})
+
+@app.route("/api/sessions/<session_id>", methods=["DELETE"])
+def delete_session(session_id):
+    """Stop and remove a session"""
+    if not session_manager.delete(session_id):
+        return jsonify({"success": False, "message": "Session not found"}), 404
+    
+    return jsonify({"success": True, "message": "Session deleted"})
+
+@app.route("/api/sessions/<session_id>/results")
+def get_session_results(session_id):
+    """Get a session's recent detection results"""
+    session = session_manager.get(session_id)
+    if session is None:
+        return jsonify({"success": False, "message": "Session not found"}), 404
+    
+    return jsonify({"results": session.get_results()})
+
+@app.route("/api/sessions/<session_id>/video_feed")
+def session_video_feed(session_id):
+    """Video streaming route for a session"""
+    if session_manager.get(session_id) is None:
+        return jsonify({"success": False, "message": "Session not found"}), 404
+    
+    return Response(generate_frames(session_id),
+                    mimetype="multipart/x-mixed-replace; boundary=frame")
+
+@app.route("/api/clips")
+def get_clips():
+    """List recorded violation clips, filtered by camera (session id) and time range"""
+    try:
+        since = float(request.args["since"]) if "since" in request.args else None
+        until = float(request.args["until"]) if "until" in request.args else None
+    except ValueError:
+        return jsonify({"success": False, "message": "since and until must be Unix timestamps"}), 400
+    
+    clips = list_clips(DEFAULT_CLIPS_DIR, request.args.get("camera"), since, until)
+    return jsonify({"clips": clips})
+
+@app.route("/api/clips/<clip_id>")
+def get_clip(clip_id):
+    """Download a recorded violation clip"""
+    for clip in list_clips(DEFAULT_CLIPS_DIR):
+        if clip["id"] == clip_id and os.path.exists(clip["path"]):
+            return send_file(os.path.abspath(clip["path"]), mimetype="video/mp4")
+    
+    return jsonify({"success": False, "message": "Clip not found"}), 404
+
 if __name__ == "__main__":
     print("Starting PPE Detection API Server...")
     # Create output directory if it doesn't exist
     os.makedirs("output", exist_ok=True)
     # Run the Flask app
-    app.run(host="0.0.0.0", port=5000, debug=True, threaded=True) 
\ No newline at end of file
+    app.run(host="0.0.0.0", port=5000, debug=DEBUG, threaded=True) 
\ No newline at end of file
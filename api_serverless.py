@@ -1,11 +1,7 @@
-from flask import Flask, Response, jsonify, request
 from http.server import BaseHTTPRequestHandler
 import json
-import os
-import base64
-import numpy as np
-import time
 from datetime import datetime
+from result_cache import result_cache, make_cache_key, decode_image_data, model_fingerprint, DEFAULT_CONF, DEFAULT_IOU
 
 # Mock data for demonstration purposes
 mock_detection_results = [
@@ -32,7 +28,8 @@ class handler(BaseHTTPRequestHandler):
                 "detection_active": True,
                 "helmet_count": 5,
                 "vest_count": 4,
-                "violation_count": 1
+                "violation_count": 1,
+                "cache": result_cache.stats()
             }
             
             self.wfile.write(json.dumps(response).encode())
@@ -73,23 +70,48 @@ class handler(BaseHTTPRequestHandler):
             post_data = self.rfile.read(content_length)
             data = json.loads(post_data.decode('utf-8'))
             
-            # Here you would process the uploaded image
-            # For demo purposes, we'll just return a mock response
+            # Look up repeated uploads of the same image in the result cache
+            cache_key = None
+            detections = None
+            if data.get('image'):
+                try:
+                    image_bytes = decode_image_data(data['image'])
+                    cache_key = make_cache_key(image_bytes, model_fingerprint(),
+                                               data.get('conf', DEFAULT_CONF), data.get('iou', DEFAULT_IOU))
+                except (TypeError, ValueError) as e:
+                    # Malformed base64 or non-numeric conf/iou
+                    self.send_response(400)
+                    self.send_header('Content-type', 'application/json')
+                    self.send_header('Access-Control-Allow-Origin', '*')
+                    self.end_headers()
+                    self.wfile.write(json.dumps({"error": f"Invalid request: {e}"}).encode())
+                    return
+                detections = result_cache.get(cache_key)
+            cached = detections is not None
             
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
+            if not cached:
+                # Here you would process the uploaded image
+                # For demo purposes, we'll just return a mock response
+                detections = [
+                    {"type": "helmet", "detected": True, "confidence": 0.95},
+                    {"type": "vest", "detected": True, "confidence": 0.89}
+                ]
+                # Only the detections are cached, so every endpoint can share entries
+                if cache_key is not None:
+                    result_cache.put(cache_key, detections)
             
             response = {
                 "success": True,
                 "message": "Image processed successfully",
-                "detections": [
-                    {"type": "helmet", "detected": True, "confidence": 0.95},
-                    {"type": "vest", "detected": True, "confidence": 0.89}
-                ]
+                "detections": detections,
+                "cached": cached
             }
             
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            
             self.wfile.write(json.dumps(response).encode())
             return
         
@@ -0,0 +1,93 @@
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+# Entry points, as module names or file paths relative to the project root
+ENTRY_POINTS = ['api_server', 'api_serverless', 'api/index.py', 'api/socket.py']
+
+# Modules that dominate cold-start time when imported eagerly
+HEAVY_MODULES = ['torch', 'ultralytics', 'cv2', 'numpy', 'flask']
+
+# Runs in a fresh interpreter so every measurement is a cold import
+MEASURE_SCRIPT = '''
+import importlib.util, json, os, sys, time
+entry = sys.argv[1]
+sys.path.insert(0, os.getcwd())
+start = time.perf_counter()
+if entry.endswith('.py'):
+    spec = importlib.util.spec_from_file_location('entry', entry)
+    spec.loader.exec_module(importlib.util.module_from_spec(spec))
+else:
+    __import__(entry)
+elapsed = time.perf_counter() - start
+heavy = [name for name in %r if name in sys.modules]
+print(json.dumps({"seconds": elapsed, "heavy": heavy}))
+''' % (HEAVY_MODULES,)
+
+def measure(entry, cwd, runs):
+    """Import an entry point in fresh interpreters and return timings and heavy modules"""
+    timings = []
+    heavy = []
+    for _ in range(runs):
+        # Keep the API server from loading the model in the background while it is measured
+        env = dict(os.environ, PPE_PRELOAD="0")
+        proc = subprocess.run([sys.executable, '-c', MEASURE_SCRIPT, entry], cwd=cwd,
+                              capture_output=True, text=True, env=env)
+        if proc.returncode != 0:
+            error = proc.stderr.strip().splitlines()
+            return {"error": error[-1] if error else "import failed"}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        timings.append(result["seconds"])
+        heavy = result["heavy"]
+    return {"median_ms": 1000 * statistics.median(timings), "heavy": heavy}
+
+def checkout(ref, directory):
+    """Extract a git revision of the project into a directory"""
+    archive = subprocess.run(['git', 'archive', '--format=tar', ref],
+                             capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory)
+
+def format_result(result):
+    if "error" in result:
+        return f"{'error':>10}  {result['error']}"
+    return f"{result['median_ms']:>8.1f}ms  {', '.join(result['heavy']) or '-'}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start import time of each entry point")
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters per entry point")
+    parser.add_argument('--compare', metavar='REF', help="Git revision to compare against, e.g. HEAD~1")
+    args = parser.parse_args()
+
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+
+    with tempfile.TemporaryDirectory() as baseline_dir:
+        if args.compare:
+            checkout(args.compare, baseline_dir)
+
+        for entry in ENTRY_POINTS:
+            print(entry)
+            current = measure(entry, project_dir, args.runs)
+
+            if args.compare:
+                entry_file = entry if entry.endswith('.py') else f"{entry}.py"
+                if os.path.exists(os.path.join(baseline_dir, entry_file)):
+                    baseline = measure(entry, baseline_dir, args.runs)
+                    print(f"  {args.compare:<10}{format_result(baseline)}")
+                    if "error" not in baseline and "error" not in current:
+                        speedup = baseline["median_ms"] / current["median_ms"]
+                        print(f"  {'current':<10}{format_result(current)}  ({speedup:.1f}x speed-up)")
+                        continue
+                else:
+                    print(f"  {args.compare:<10}{'missing':>10}")
+
+            print(f"  {'current':<10}{format_result(current)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import deque
+
+# cv2 and numpy are imported where they are used so the API server starts quickly
+
+DEFAULT_CLIPS_DIR = os.environ.get("PPE_CLIPS_DIR", "clips")
+DEFAULT_PRE_ROLL = 5.0  # seconds of video kept before a violation
+DEFAULT_POST_ROLL = 5.0  # seconds recorded after the last violation
+MAX_CLIP_SECONDS = 120  # long events are split into several clips
+MAX_PRE_ROLL_BYTES = 32 * 1024 * 1024  # memory budget for each pre-roll buffer
+MAX_PENDING_BYTES = 128 * 1024 * 1024  # frames waiting for the writer before new ones are dropped
+JPEG_QUALITY = 80
+
+# A violation class must be seen in this many of its last few detection results to start a clip
+VIOLATION_MIN_HITS = 3
+VIOLATION_WINDOW = 5
+
+def safe_path_component(name):
+    """Turn a camera name into a single path component that cannot leave the clips folder"""
+    slug = re.sub(r'[^A-Za-z0-9_-]', '_', str(name))[:64]
+    return slug or "camera"
+
+class Clip:
+    """Metadata for one violation clip"""
+
+    def __init__(self, camera, source, fps, clips_dir, start_time):
+        self.id = uuid.uuid4().hex[:12]
+        self.camera = camera
+        self.source = source
+        self.fps = fps
+        self.start_time = start_time
+        self.end_time = None
+        self.classes = set()
+        self.frames = 0
+        self.size = None
+
+        # Index clips by camera and date on disk
+        started = time.localtime(self.start_time)
+        self.path = os.path.join(
+            clips_dir, safe_path_component(camera), time.strftime("%Y-%m-%d", started),
+            f"{time.strftime('%H%M%S', started)}_{self.id}.mp4"
+        )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "camera": self.camera,
+            "source": self.source,
+            "start": self.start_time,
+            "end": self.end_time,
+            "classes": sorted(self.classes),
+            "frames": self.frames,
+            "path": self.path
+        }
+
+def list_clips(clips_dir=DEFAULT_CLIPS_DIR, camera=None, since=None, until=None):
+    """Read the clip index, optionally filtered by camera and time range"""
+    clips = []
+    try:
+        with open(os.path.join(clips_dir, "index.jsonl")) as f:
+            for line in f:
+                try:
+                    clip = json.loads(line)
+                except ValueError:
+                    continue
+                if camera is not None and str(clip["camera"]) != str(camera):
+                    continue
+                if since is not None and clip["end"] < since:
+                    continue
+                if until is not None and clip["start"] > until:
+                    continue
+                clips.append(clip)
+    except FileNotFoundError:
+        pass
+    return clips
+
+class ClipWriter:
+    """Background thread that decodes buffered frames and writes clip files
+
+    Recorders only put messages on an unbounded queue, so a slow disk never
+    blocks the capture or inference threads. Frames are dropped instead if more
+    than MAX_PENDING_BYTES are waiting.
+    """
+
+    def __init__(self, clips_dir=DEFAULT_CLIPS_DIR):
+        self.clips_dir = clips_dir
+        self.index_path = os.path.join(clips_dir, "index.jsonl")
+        self.queue = queue.Queue()
+        self.pending_bytes = 0
+        self.dropped_frames = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def start_clip(self, clip):
+        self.queue.put(("start", clip, None))
+
+    def add_frame(self, clip, jpeg):
+        """Queue an encoded frame, returning False if it was dropped"""
+        with self.lock:
+            if self.pending_bytes + len(jpeg) > MAX_PENDING_BYTES:
+                self.dropped_frames += 1
+                return False
+            self.pending_bytes += len(jpeg)
+        self.queue.put(("frame", clip, jpeg))
+        return True
+
+    def finish_clip(self, clip):
+        self.queue.put(("finish", clip, None))
+
+    def run(self):
+        import cv2
+        import numpy as np
+
+        writers = {}
+        while True:
+            action, clip, jpeg = self.queue.get()
+            try:
+                if action == "start":
+                    os.makedirs(os.path.dirname(clip.path), exist_ok=True)
+                    writers[clip.id] = None
+
+                elif action == "frame":
+                    with self.lock:
+                        self.pending_bytes -= len(jpeg)
+                    frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+                    if frame is None or clip.id not in writers:
+                        continue
+
+                    # Open the writer on the first frame, when the size is known
+                    writer = writers[clip.id]
+                    if writer is None:
+                        height, width = frame.shape[:2]
+                        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+                        writer = cv2.VideoWriter(clip.path, fourcc, clip.fps, (width, height))
+                        writers[clip.id] = writer
+                        clip.size = (width, height)
+                    elif (frame.shape[1], frame.shape[0]) != clip.size:
+                        frame = cv2.resize(frame, clip.size)
+                    writer.write(frame)
+                    clip.frames += 1
+
+                elif action == "finish":
+                    writer = writers.pop(clip.id, None)
+                    if writer is None:
+                        continue
+                    writer.release()
+                    with open(self.index_path, "a") as f:
+                        f.write(json.dumps(clip.to_dict()) + "\n")
+                    print(f"Saved violation clip {clip.path} ({clip.frames} frames)")
+
+            except Exception as e:
+                print(f"Error writing clip {clip.id}: {e}")
+
+class ClipRecorder:
+    """Keeps a compressed pre-roll of recent frames and records clips around violations
+
+    Frames are added from a session's capture thread and detection results from the
+    inference thread. Violations are debounced per class: a clip starts once one NO-*
+    class is seen in VIOLATION_MIN_HITS of its last VIOLATION_WINDOW results, so
+    different classes flickering in and out do not add up to a trigger. The clip
+    includes the pre-roll buffer and ends post_roll seconds after the last violation.
+    """
+
+    def __init__(self, writer, camera, source=None, fps=30, pre_roll=DEFAULT_PRE_ROLL, post_roll=DEFAULT_POST_ROLL):
+        self.writer = writer
+        self.camera = camera
+        self.source = source
+        self.fps = fps
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.lock = threading.Lock()
+
+        # Ring buffer of (timestamp, jpeg bytes)
+        self.buffer = deque()
+        self.buffer_bytes = 0
+
+        # Recent hits per violation class
+        self.recent = {}
+        self.clip = None
+        self.closed = False
+        self.last_violation = 0.0
+        self.clips_recorded = 0
+
+    def add_frame(self, frame):
+        """Encode a captured frame into the pre-roll buffer, or the active clip"""
+        import cv2
+
+        success, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        if not success:
+            return
+        jpeg = encoded.tobytes()
+        now = time.time()
+
+        with self.lock:
+            if self.closed:
+                return
+            if self.clip is not None:
+                self.writer.add_frame(self.clip, jpeg)
+                self.finish_if_done(now)
+                return
+
+            self.buffer.append((now, jpeg))
+            self.buffer_bytes += len(jpeg)
+            while self.buffer and (now - self.buffer[0][0] > self.pre_roll or self.buffer_bytes > MAX_PRE_ROLL_BYTES):
+                _, old = self.buffer.popleft()
+                self.buffer_bytes -= len(old)
+
+    def update(self, results):
+        """Track violations in the latest detection results"""
+        violations = {
+            detection["type"] for detection in results.get("detections", [])
+            if detection.get("type", "").startswith("NO-") and detection.get("detected", False)
+        }
+        now = time.time()
+
+        with self.lock:
+            # Results still in flight after close() must not start a clip
+            if self.closed:
+                return
+
+            for name in set(self.recent) | violations:
+                hits = self.recent.setdefault(name, deque(maxlen=VIOLATION_WINDOW))
+                hits.append(name in violations)
+                if not any(hits):
+                    del self.recent[name]
+
+            if self.clip is not None:
+                if violations:
+                    self.last_violation = now
+                    self.clip.classes.update(violations)
+                self.finish_if_done(now)
+                return
+
+            # Debounce: ignore single-frame false positives
+            triggered = {name for name in violations if sum(self.recent[name]) >= VIOLATION_MIN_HITS}
+            if triggered:
+                self.last_violation = now
+                self.start_clip(triggered)
+
+    def start_clip(self, violations):
+        """Start a clip with the pre-roll frames (lock held)"""
+        # Use the measured frame rate so clips play back at real speed
+        fps = self.fps
+        if len(self.buffer) > 1:
+            duration = self.buffer[-1][0] - self.buffer[0][0]
+            if duration > 0:
+                fps = (len(self.buffer) - 1) / duration
+
+        # The clip starts with the oldest pre-roll frame
+        start_time = self.buffer[0][0] if self.buffer else time.time()
+        self.clip = Clip(self.camera, self.source, fps, self.writer.clips_dir, start_time)
+        self.clip.classes.update(violations)
+        self.writer.start_clip(self.clip)
+        print(f"[{self.camera}] Violation detected ({', '.join(sorted(violations))}), recording clip {self.clip.id}")
+
+        for _, jpeg in self.buffer:
+            self.writer.add_frame(self.clip, jpeg)
+        self.buffer.clear()
+        self.buffer_bytes = 0
+
+    def finish_if_done(self, now):
+        """End the active clip after the post-roll or at the length limit (lock held)"""
+        if now - self.last_violation < self.post_roll and now - self.clip.start_time < MAX_CLIP_SECONDS:
+            return
+        self.finish_clip(now)
+
+    def finish_clip(self, now):
+        """Hand the active clip to the writer for closing (lock held)"""
+        self.clip.end_time = now
+        self.writer.finish_clip(self.clip)
+        self.clip = None
+        self.recent.clear()
+        self.clips_recorded += 1
+
+    def close(self):
+        """Finish any clip in progress and stop recording"""
+        with self.lock:
+            self.closed = True
+            if self.clip is not None:
+                self.finish_clip(time.time())
+            self.buffer.clear()
+            self.buffer_bytes = 0
@@ -0,0 +1,6 @@
+# Detection defaults shared by the model code, the API server and the serverless
+# handlers. Keep this module free of heavy imports so every entry point can use it.
+
+# Default detection thresholds
+DEFAULT_CONF = 0.25
+DEFAULT_IOU = 0.45
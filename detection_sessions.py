@@ -0,0 +1,529 @@
+import re
+import threading
+import time
+import uuid
+from collections import deque
+
+from clip_recorder import ClipRecorder, ClipWriter, DEFAULT_PRE_ROLL, DEFAULT_POST_ROLL
+from detection_config import DEFAULT_CONF, DEFAULT_IOU
+
+# cv2 and ppe_detection (torch, ultralytics) are imported where they are first
+# needed so the API server can start answering requests before they are loaded
+
+# Limits for per-session settings
+DEFAULT_FPS = 30
+MAX_FPS = 30
+DEFAULT_PRIORITY = 1
+MAX_PRIORITY = 10
+DEFAULT_MAX_RESULTS = 50
+MAX_PRE_ROLL = 30
+MAX_POST_ROLL = 60
+MAX_FRAME_FAILURES = 10
+
+# Session ids appear in URLs and clip paths
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+
+def parse_session_config(data, partial=False):
+    """Validate session settings from an API request, raising ValueError on bad input"""
+    config = {}
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        raise ValueError("settings must be a JSON object")
+
+    if 'id' in data:
+        if not isinstance(data['id'], str) or not SESSION_ID_PATTERN.match(data['id']):
+            raise ValueError("id must be 1-32 letters, digits, '_' or '-'")
+        config['id'] = data['id']
+
+    if 'source' in data:
+        source = data['source']
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)
+        if not isinstance(source, (int, str)) or isinstance(source, bool) or source == '':
+            raise ValueError("source must be 'auto', a camera index or a video path/URL")
+        config['source'] = source
+    elif not partial:
+        config['source'] = 'auto'
+
+    for key, default in (('conf', DEFAULT_CONF), ('iou', DEFAULT_IOU)):
+        if key in data:
+            try:
+                value = float(data[key])
+            except (TypeError, ValueError):
+                raise ValueError(f"{key} must be a number")
+            if not 0.0 < value <= 1.0:
+                raise ValueError(f"{key} must be between 0 and 1")
+            config[key] = value
+        elif not partial:
+            config[key] = default
+
+    if 'classes' in data:
+        classes = data['classes']
+        if classes is not None and (not isinstance(classes, list) or not all(isinstance(c, str) for c in classes)):
+            raise ValueError("classes must be a list of class names")
+        config['classes'] = classes or None
+    elif not partial:
+        config['classes'] = None
+
+    for key, default, maximum in (('fps', DEFAULT_FPS, MAX_FPS), ('priority', DEFAULT_PRIORITY, MAX_PRIORITY)):
+        if key in data:
+            if key == 'priority':
+                # Reject 2.9 or true instead of truncating them
+                if not isinstance(data[key], int) or isinstance(data[key], bool):
+                    raise ValueError(f"{key} must be a whole number")
+                value = data[key]
+            else:
+                try:
+                    value = float(data[key])
+                except (TypeError, ValueError):
+                    raise ValueError(f"{key} must be a number")
+            if not 0 < value <= maximum:
+                raise ValueError(f"{key} must be between 0 and {maximum}")
+            config[key] = value
+        elif not partial:
+            config[key] = default
+
+    if 'name' in data:
+        config['name'] = str(data['name'])
+
+    # Violation clip recording
+    if 'record' in data:
+        if not isinstance(data['record'], bool):
+            raise ValueError("record must be true or false")
+        config['record'] = data['record']
+    elif not partial:
+        config['record'] = False
+
+    for key, default, maximum in (('pre_roll', DEFAULT_PRE_ROLL, MAX_PRE_ROLL), ('post_roll', DEFAULT_POST_ROLL, MAX_POST_ROLL)):
+        if key in data:
+            try:
+                value = float(data[key])
+            except (TypeError, ValueError):
+                raise ValueError(f"{key} must be a number")
+            if not 0 <= value <= maximum:
+                raise ValueError(f"{key} must be between 0 and {maximum} seconds")
+            config[key] = value
+        elif not partial:
+            config[key] = default
+
+    return config
+
+def open_source(source):
+    """Open a camera index, video file or stream URL ('auto' tries cameras 0-2)"""
+    import cv2
+
+    try:
+        candidates = [0, 1, 2] if source == 'auto' else [source]
+        for candidate in candidates:
+            print(f"Attempting to open video source {candidate}")
+            capture = cv2.VideoCapture(candidate)
+            if capture.isOpened():
+                print(f"Successfully opened video source {candidate}")
+
+                # Set optimal properties for cameras
+                if isinstance(candidate, int):
+                    capture.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+                    capture.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+                    capture.set(cv2.CAP_PROP_FPS, 30)
+                return capture
+            capture.release()
+
+        print(f"Error: Could not open video source {source}")
+        return None
+    except Exception as e:
+        print(f"Error opening video source {source}: {e}")
+        return None
+
+def extract_detection_results(results):
+    """Convert model results into the JSON-friendly format used by the API"""
+    detections = []
+    for result in results:
+        boxes = result.boxes
+        for box in boxes:
+            cls = int(box.cls[0])
+            conf = float(box.conf[0])
+            class_name = result.names[cls]
+
+            detections.append({
+                "type": class_name,
+                "detected": True,  # Since it was detected
+                "confidence": conf
+            })
+
+    timestamp = time.strftime("%H:%M:%S")
+    return {"timestamp": timestamp, "detections": detections}
+
+class DetectionSession:
+    """A single detection run with its own source, settings and result buffer"""
+
+    def __init__(self, session_id, source='auto', conf=DEFAULT_CONF, iou=DEFAULT_IOU, classes=None,
+                 fps=DEFAULT_FPS, priority=DEFAULT_PRIORITY, name=None, max_results=DEFAULT_MAX_RESULTS,
+                 record=False, pre_roll=DEFAULT_PRE_ROLL, post_roll=DEFAULT_POST_ROLL, clip_writer=None):
+        self.id = session_id
+        self.name = name or session_id
+        self.source = source
+        self.conf = conf
+        self.iou = iou
+        self.classes = classes
+        self.fps = fps
+        self.priority = priority
+        self.created_at = time.time()
+
+        self.capture = None
+        self.active = False
+        self.thread = None
+        self.lock = threading.Lock()
+
+        # Latest frame waiting for inference, and the latest processed output
+        self.pending_frame = None
+        self.output_frame = None
+        self.results = deque(maxlen=max_results)
+
+        # Records clips around violations when enabled
+        self.recorder = None
+        if record and clip_writer is not None:
+            self.recorder = ClipRecorder(clip_writer, session_id, source, fps, pre_roll, post_roll)
+
+        # Counters
+        self.violation_count = 0
+        self.helmet_count = 0
+        self.vest_count = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+
+        # Virtual time used by the scheduler for fair sharing
+        self.pass_value = 0.0
+
+        # Class filter that unknown class names were last reported for
+        self.warned_classes = None
+
+    def open(self):
+        """Open the video source, returning True on success"""
+        self.capture = open_source(self.source)
+        return self.capture is not None
+
+    def start(self, scheduler):
+        """Start the capture thread that feeds frames to the scheduler"""
+        self.active = True
+        self.thread = threading.Thread(target=self.capture_loop, args=(scheduler,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop capturing and release the video source"""
+        self.active = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2)
+        if self.capture is not None and self.capture.isOpened():
+            self.capture.release()
+        self.capture = None
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def update(self, config):
+        """Apply new settings to a running session"""
+        with self.lock:
+            for key in ('conf', 'iou', 'classes', 'fps', 'priority', 'name'):
+                if key in config:
+                    setattr(self, key, config[key])
+
+    def capture_loop(self, scheduler):
+        """Background thread reading frames from the source at the session's FPS cap"""
+        frame_failure_count = 0
+
+        try:
+            while self.active:
+                frame_start = time.time()
+                try:
+                    if self.capture is None or not self.capture.isOpened():
+                        print(f"[{self.id}] Video source disconnected, attempting to reconnect...")
+                        if not self.open():
+                            print(f"[{self.id}] Failed to reconnect video source, stopping session")
+                            self.active = False
+                            break
+
+                    success, frame = self.capture.read()
+                    if not success or frame is None or frame.size == 0:
+                        frame_failure_count += 1
+                        print(f"[{self.id}] Error reading frame (failure {frame_failure_count}/{MAX_FRAME_FAILURES})")
+
+                        if frame_failure_count >= MAX_FRAME_FAILURES:
+                            print(f"[{self.id}] Too many frame reading failures, attempting to reinitialize video source")
+                            self.capture.release()
+                            if not self.open():
+                                print(f"[{self.id}] Failed to reinitialize video source, stopping session")
+                                self.active = False
+                                break
+                            frame_failure_count = 0
+
+                        time.sleep(0.5)  # Wait a bit before retrying
+                        continue
+
+                    # Reset failure counter on successful frame read
+                    frame_failure_count = 0
+
+                    # Buffer the frame for violation clips before it is annotated
+                    if self.recorder is not None:
+                        self.recorder.add_frame(frame)
+                    scheduler.submit(self, frame)
+
+                except Exception as e:
+                    print(f"[{self.id}] Error in capture thread: {e}")
+
+                # Respect the FPS cap
+                remaining = 1.0 / self.fps - (time.time() - frame_start)
+                if remaining > 0:
+                    time.sleep(remaining)
+        finally:
+            # Close any clip in progress however the loop ends, e.g. when the camera drops
+            if self.recorder is not None:
+                self.recorder.close()
+
+    def record(self, processed_frame, results):
+        """Store a processed frame and its detections, updating the counters"""
+        with self.lock:
+            self.output_frame = processed_frame
+            self.results.append(results)
+            self.frames_processed += 1
+
+            for detection in results.get("detections", []):
+                type_name = detection.get("type", "")
+                if type_name.startswith("NO-") and detection.get("detected", False):
+                    self.violation_count += 1
+                elif (type_name == "Hardhat" or type_name == "helmet") and detection.get("detected", False):
+                    self.helmet_count += 1
+                elif (type_name == "Safety Vest" or type_name == "vest") and detection.get("detected", False):
+                    self.vest_count += 1
+
+        if self.recorder is not None:
+            self.recorder.update(results)
+
+    def get_output_frame(self):
+        """Return a copy of the latest processed frame, or None"""
+        with self.lock:
+            return None if self.output_frame is None else self.output_frame.copy()
+
+    def get_results(self):
+        """Return the buffered detection results, oldest first"""
+        with self.lock:
+            return list(self.results)
+
+    def to_dict(self):
+        """Session settings and counters for the API"""
+        with self.lock:
+            return {
+                "id": self.id,
+                "name": self.name,
+                "source": self.source,
+                "active": self.active,
+                "conf": self.conf,
+                "iou": self.iou,
+                "classes": self.classes,
+                "fps": self.fps,
+                "priority": self.priority,
+                "created_at": self.created_at,
+                "violations": self.violation_count,
+                "helmets": self.helmet_count,
+                "vests": self.vest_count,
+                "frames_processed": self.frames_processed,
+                "frames_dropped": self.frames_dropped,
+                "record": self.recorder is not None,
+                "clips_recorded": self.recorder.clips_recorded if self.recorder is not None else 0
+            }
+
+class InferenceScheduler:
+    """Runs the shared model over frames from all sessions with fair, priority-aware scheduling
+
+    Each session keeps only its latest frame. The scheduler uses stride scheduling:
+    it always serves the ready session with the lowest virtual time and then advances
+    that session's virtual time by 1/priority, so a priority 2 session gets twice the
+    inference slots of a priority 1 session when the model is the bottleneck.
+    """
+
+    def __init__(self):
+        self.model = None
+        self.model_status = "not_loaded"
+        self.model_lock = threading.Lock()
+        self.sessions = []
+        self.condition = threading.Condition()
+        self.thread = None
+        self.virtual_time = 0.0
+
+    def register(self, session):
+        """Add a session and make sure the scheduler thread is running"""
+        with self.condition:
+            # New sessions start at the current virtual time so they cannot starve others
+            session.pass_value = self.virtual_time
+            self.sessions.append(session)
+
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def unregister(self, session):
+        """Remove a session from scheduling"""
+        with self.condition:
+            if session in self.sessions:
+                self.sessions.remove(session)
+            session.pending_frame = None
+
+    def submit(self, session, frame):
+        """Queue a session's latest frame, replacing any frame not yet processed"""
+        with self.condition:
+            if session.pending_frame is not None:
+                session.frames_dropped += 1
+            session.pending_frame = frame
+            self.condition.notify()
+
+    def next_session(self):
+        """Pick the ready session with the lowest virtual time (condition held)"""
+        ready = [s for s in self.sessions if s.active and s.pending_frame is not None]
+        if not ready:
+            return None
+        return min(ready, key=lambda s: (s.pass_value, -s.priority, s.created_at))
+
+    def load(self):
+        """Load the shared model once, returning True when it is ready"""
+        with self.model_lock:
+            if self.model is None:
+                self.model_status = "loading"
+                try:
+                    from ppe_detection import load_model
+                    self.model = load_model()
+                except Exception as e:
+                    # A missing dependency must not leave the status stuck at "loading"
+                    print(f"Error loading model: {e}")
+                    self.model = None
+                self.model_status = "ready" if self.model is not None else "failed"
+            return self.model is not None
+
+    def preload(self):
+        """Start loading the model in the background unless it is loaded or loading"""
+        if self.model_status in ("not_loaded", "failed"):
+            # Set here so concurrent callers do not start a second thread
+            self.model_status = "loading"
+            threading.Thread(target=self.load, daemon=True).start()
+
+    def run(self):
+        """Scheduler thread: load the shared model and process frames"""
+        if not self.load():
+            print("Failed to load model, stopping all sessions")
+            with self.condition:
+                sessions = list(self.sessions)
+                self.sessions = []
+                # Let the next registered session retry loading the model
+                self.thread = None
+            for session in sessions:
+                session.stop()
+            return
+
+        while True:
+            with self.condition:
+                session = self.next_session()
+                while session is None:
+                    self.condition.wait(timeout=1.0)
+                    session = self.next_session()
+
+                frame = session.pending_frame
+                session.pending_frame = None
+                self.virtual_time = session.pass_value
+                session.pass_value += 1.0 / session.priority
+
+            try:
+                self.process(session, frame)
+            except Exception as e:
+                print(f"[{session.id}] Error running detection: {e}")
+
+    def check_classes(self, class_names):
+        """Raise ValueError for class names the loaded model does not know"""
+        if not class_names or self.model is None:
+            return
+        unknown = set(class_names) - set(self.model.names.values())
+        if unknown:
+            raise ValueError(f"Unknown classes: {', '.join(sorted(unknown))} "
+                             f"(available: {', '.join(self.model.names.values())})")
+
+    def process(self, session, frame):
+        """Run the model on one frame with the session's settings"""
+        with session.lock:
+            conf, iou, class_names = session.conf, session.iou, session.classes
+
+        class_ids = None
+        if class_names:
+            class_ids = [idx for idx, name in self.model.names.items() if name in class_names]
+
+            # Sessions created before the model loaded are not validated, so warn once
+            unknown = set(class_names) - set(self.model.names.values())
+            if unknown and session.warned_classes != class_names:
+                print(f"[{session.id}] Unknown classes ignored: {', '.join(sorted(unknown))}")
+                session.warned_classes = class_names
+
+            # No known classes left: detect everything rather than nothing
+            if not class_ids:
+                class_ids = None
+
+        import cv2
+        from ppe_detection import draw_detections
+
+        fps_start = cv2.getTickCount()
+        results = self.model(frame, conf=conf, iou=iou, classes=class_ids, verbose=False)
+        detection_results = extract_detection_results(results)
+        processed_frame = draw_detections(frame, results, fps_start)
+        session.record(processed_frame, detection_results)
+
+class SessionManager:
+    """Creates, lists and deletes detection sessions sharing one model"""
+
+    def __init__(self):
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.scheduler = InferenceScheduler()
+        self.clip_writer = None
+
+    def create(self, config, session_id=None):
+        """Create and start a session; raises ValueError for bad settings or sources"""
+        config = dict(config)
+        requested_id = config.pop('id', None)
+        session_id = session_id or requested_id or uuid.uuid4().hex[:8]
+        self.scheduler.check_classes(config.get('classes'))
+        with self.lock:
+            if session_id in self.sessions:
+                raise ValueError(f"Session {session_id} already exists")
+            # Start the clip writer the first time a session records
+            if config.get('record') and self.clip_writer is None:
+                self.clip_writer = ClipWriter()
+            session = DetectionSession(session_id, clip_writer=self.clip_writer, **config)
+            self.sessions[session_id] = session
+
+        if not session.open():
+            with self.lock:
+                self.sessions.pop(session_id, None)
+            raise ValueError(f"Failed to open video source {session.source}")
+
+        self.scheduler.register(session)
+        session.start(self.scheduler)
+        return session
+
+    def get(self, session_id):
+        with self.lock:
+            return self.sessions.get(session_id)
+
+    def list(self):
+        with self.lock:
+            return list(self.sessions.values())
+
+    def update(self, session, config):
+        """Apply validated settings to a running session"""
+        self.scheduler.check_classes(config.get('classes'))
+        session.update(config)
+
+    def delete(self, session_id):
+        """Stop and remove a session, returning False if it does not exist"""
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+        if session is None:
+            return False
+
+        self.scheduler.unregister(session)
+        session.stop()
+        return True
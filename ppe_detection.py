@@ -5,9 +5,20 @@ import time
 import torch
 import os
 import sys
+import hashlib
+from detection_config import DEFAULT_CONF, DEFAULT_IOU
 
-def load_model():
-    """Load the YOLOv8 model"""
+# Supported INT8 post-training quantization modes
+QUANTIZE_MODES = ('dynamic', 'static')
+MAX_CALIBRATION_IMAGES = 200
+
+def load_model(quantize=None, calibration_dir=None):
+    """Load the YOLOv8 model, optionally as an INT8 quantized model for CPU inference"""
+    # Allow deployments to pick the quantization mode without code changes
+    if quantize is None:
+        quantize = os.environ.get('PPE_QUANTIZE') or None
+    calibration_dir = calibration_dir or os.environ.get('PPE_CALIBRATION_DIR') or None
+    
     try:
         print("Attempting to load model...")
         
@@ -29,6 +40,13 @@ def load_model():
             # Restore original torch.load even if model loading fails
             torch.load = original_torch_load
         
+        if quantize:
+            quantized_model = load_quantized_model(model, quantize, calibration_dir)
+            if quantized_model is None:
+                print("Falling back to the FP32 model")
+                return model
+            return quantized_model
+        
         return model
     except Exception as e:
         print(f"Error loading model: {e}")
@@ -37,14 +55,133 @@ def load_model():
         print("2. Retraining the model with your current environment")
         return None
 
-def process_frame(frame, model, fps_start):
+def preprocess_for_onnx(image, imgsz=640):
+    """Letterbox a BGR image into the NCHW float32 tensor expected by the exported model"""
+    height, width = image.shape[:2]
+    scale = min(imgsz / height, imgsz / width)
+    new_width, new_height = int(round(width * scale)), int(round(height * scale))
+    resized = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    
+    # Pad to a square canvas with the same grey used by Ultralytics
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top = (imgsz - new_height) // 2
+    left = (imgsz - new_width) // 2
+    canvas[top:top + new_height, left:left + new_width] = resized
+    
+    # BGR -> RGB, HWC -> CHW, scale to [0, 1]
+    tensor = canvas[:, :, ::-1].transpose(2, 0, 1)
+    tensor = np.ascontiguousarray(tensor, dtype=np.float32) / 255.0
+    return tensor[np.newaxis]
+
+def list_images(folder):
+    """List image files in a folder, sorted by name"""
+    extensions = ('.jpg', '.jpeg', '.png', '.bmp')
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(extensions)
+    )
+
+def calibration_fingerprint(calibration_dir, max_images=MAX_CALIBRATION_IMAGES):
+    """Short hash of the calibration images (names, sizes and modification times)"""
+    digest = hashlib.blake2b(digest_size=4)
+    for path in list_images(calibration_dir)[:max_images]:
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}|{stat.st_size}|{int(stat.st_mtime)}\n".encode())
+    return digest.hexdigest()
+
+def make_calibration_reader(calibration_dir, input_name, imgsz=640, max_images=MAX_CALIBRATION_IMAGES):
+    """Create an ONNX Runtime calibration reader that feeds site images"""
+    from onnxruntime.quantization import CalibrationDataReader
+    
+    class SiteImageCalibrationReader(CalibrationDataReader):
+        def __init__(self):
+            self.paths = iter(list_images(calibration_dir)[:max_images])
+        
+        def get_next(self):
+            for path in self.paths:
+                image = cv2.imread(path)
+                if image is None:
+                    print(f"Skipping unreadable calibration image {path}")
+                    continue
+                return {input_name: preprocess_for_onnx(image, imgsz)}
+            return None
+    
+    return SiteImageCalibrationReader()
+
+def load_quantized_model(model, mode='dynamic', calibration_dir=None, imgsz=640, output_path=None):
+    """Export the model to ONNX, quantize it to INT8 and load it for inference
+
+    The quantized model is cached next to the weights, keyed by the mode and, for
+    static mode, the calibration images. Passing output_path always re-quantizes.
+    """
+    if mode not in QUANTIZE_MODES:
+        print(f"Error: Unknown quantization mode '{mode}' (expected one of {', '.join(QUANTIZE_MODES)})")
+        return None
+    if mode == 'static' and not calibration_dir:
+        print("Error: Static quantization needs a folder of calibration images")
+        return None
+    
+    try:
+        import onnx
+        from onnxruntime.quantization import quantize_dynamic, quantize_static, QuantFormat, QuantType
+    except ImportError:
+        print("Error: INT8 mode requires the onnx and onnxruntime packages")
+        return None
+    
+    try:
+        weights_path = str(model.ckpt_path or 'best.pt')
+        if output_path is not None:
+            int8_path = output_path
+        elif mode == 'static':
+            # A different calibration set gives a different model
+            fingerprint = calibration_fingerprint(calibration_dir)
+            int8_path = os.path.splitext(weights_path)[0] + f'_int8_static_{fingerprint}.onnx'
+        else:
+            int8_path = os.path.splitext(weights_path)[0] + f'_int8_{mode}.onnx'
+        
+        # Reuse a previous quantization as long as it is newer than the weights
+        if (output_path is not None or not os.path.exists(int8_path)
+                or os.path.getmtime(int8_path) < os.path.getmtime(weights_path)):
+            print(f"Exporting model to ONNX for {mode} INT8 quantization...")
+            fp32_path = model.export(format='onnx', imgsz=imgsz, dynamic=False, simplify=True)
+            
+            if mode == 'dynamic':
+                quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QUInt8)
+            else:
+                input_name = onnx.load(fp32_path).graph.input[0].name
+                reader = make_calibration_reader(calibration_dir, input_name, imgsz)
+                quantize_static(fp32_path, int8_path, reader,
+                                quant_format=QuantFormat.QDQ,
+                                activation_type=QuantType.QUInt8,
+                                weight_type=QuantType.QInt8,
+                                per_channel=True)
+            
+            # Keep the class names and image size that Ultralytics stores in the metadata
+            fp32_onnx = onnx.load(fp32_path)
+            int8_onnx = onnx.load(int8_path)
+            if not int8_onnx.metadata_props:
+                int8_onnx.metadata_props.extend(fp32_onnx.metadata_props)
+                onnx.save(int8_onnx, int8_path)
+        
+        quantized_model = YOLO(int8_path, task='detect')
+        print(f"Loaded INT8 ({mode}) model from {int8_path}")
+        return quantized_model
+    except Exception as e:
+        print(f"Error quantizing model: {e}")
+        return None
+
+def process_frame(frame, model, fps_start, conf=DEFAULT_CONF, iou=DEFAULT_IOU, classes=None):
     """Process a single frame and draw detections with optimized performance"""
     if frame is None or model is None:
         return None
     
     # Perform detection with optimized settings
-    results = model(frame, conf=0.25, iou=0.45, verbose=False)
+    results = model(frame, conf=conf, iou=iou, classes=classes, verbose=False)
     
+    return draw_detections(frame, results, fps_start)
+
+def draw_detections(frame, results, fps_start):
+    """Draw detection results and the FPS counter onto a frame"""
     # Process results
     for result in results:
         boxes = result.boxes
@@ -0,0 +1,216 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from detection_config import DEFAULT_CONF, DEFAULT_IOU
+
+# Default settings, can be overridden with environment variables
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024  # 16 MB of cached results in memory
+DEFAULT_MAX_DISK_BYTES = 256 * 1024 * 1024  # 256 MB of cached results on disk
+
+def model_fingerprint(model_path='best.pt'):
+    """Return a short version string for the model file"""
+    # Size and modification time change whenever best.pt is replaced,
+    # which is enough to invalidate cached results without hashing the weights
+    try:
+        stat = os.stat(model_path)
+        version = f"{os.path.basename(model_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+    except OSError:
+        version = os.environ.get('PPE_MODEL_VERSION', os.path.basename(model_path))
+
+    # INT8 models give slightly different detections than FP32
+    quantize = os.environ.get('PPE_QUANTIZE')
+    if quantize:
+        version += f":int8-{quantize}"
+    return version
+
+def decode_image_data(image_data):
+    """Decode a base64 image string (optionally a data URL) into raw bytes"""
+    # Remove the data URL prefix if present
+    if 'base64,' in image_data:
+        image_data = image_data.split('base64,')[1]
+    return base64.b64decode(image_data)
+
+def make_cache_key(image_bytes, model_version, conf=DEFAULT_CONF, iou=DEFAULT_IOU):
+    """Build a content-addressed cache key for an image and detection settings"""
+    digest = hashlib.blake2b(image_bytes, digest_size=16)
+    digest.update(f"|{model_version}|{float(conf):.4f}|{float(iou):.4f}".encode())
+    return digest.hexdigest()
+
+class ResultCache:
+    """LRU cache of detection results with byte budgets for memory and an optional disk tier"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, cache_dir=None, max_disk_bytes=DEFAULT_MAX_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_bytes = 0
+        self.disk_lock = threading.Lock()
+        self.disk_evictions = 0
+        self.entries = OrderedDict()  # key -> serialized result
+        self.current_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except OSError as e:
+                print(f"Error creating cache directory {self.cache_dir}: {e}")
+                self.cache_dir = None
+
+        # Account for entries left by earlier runs
+        if self.cache_dir:
+            self.disk_bytes = sum(size for _, _, size in self._disk_entries())
+
+    def get(self, key):
+        """Return the cached result for a key, or None on a miss"""
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(data)
+
+        # Fall back to the disk tier
+        data = self._read_disk(key)
+        if data is not None:
+            with self.lock:
+                self.disk_hits += 1
+                self._store(key, data)
+            return json.loads(data)
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, result):
+        """Store a JSON-serializable detection result"""
+        data = json.dumps(result).encode()
+        with self.lock:
+            self._store(key, data)
+        self._write_disk(key, data)
+
+    def clear(self):
+        """Drop all in-memory entries (the disk tier is left untouched)"""
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """Return hit/miss statistics for reporting"""
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "disk_enabled": self.cache_dir is not None,
+                "disk_bytes": self.disk_bytes,
+                "max_disk_bytes": self.max_disk_bytes,
+                "disk_evictions": self.disk_evictions
+            }
+
+    def _store(self, key, data):
+        """Insert into the memory tier and evict least recently used entries (lock held)"""
+        if len(data) > self.max_bytes:
+            return
+
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.current_bytes -= len(old)
+
+        self.entries[key] = data
+        self.current_bytes += len(data)
+
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.current_bytes -= len(evicted)
+            self.evictions += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _disk_entries(self):
+        """List (mtime, path, size) for every entry in the disk tier"""
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.endswith('.json'):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((stat.st_mtime, entry.path, stat.st_size))
+        except OSError as e:
+            print(f"Error reading cache directory {self.cache_dir}: {e}")
+        return entries
+
+    def _read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        # Refresh the modification time so disk eviction is least recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def _write_disk(self, key, data):
+        if not self.cache_dir or len(data) > self.max_disk_bytes:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with self.disk_lock:
+            try:
+                old_size = os.path.getsize(path) if os.path.exists(path) else 0
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                self.disk_bytes += len(data) - old_size
+            except OSError as e:
+                print(f"Error writing cache entry {key}: {e}")
+                return
+
+            if self.disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def _evict_disk(self):
+        """Delete the least recently used files until the disk tier is under 90% of its budget (disk lock held)"""
+        entries = self._disk_entries()
+        self.disk_bytes = sum(size for _, _, size in entries)
+        for _, path, size in sorted(entries):
+            if self.disk_bytes <= 0.9 * self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.disk_bytes -= size
+            self.disk_evictions += 1
+
+# Shared cache used by the upload endpoints
+result_cache = ResultCache(
+    max_bytes=int(os.environ.get('PPE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+    cache_dir=os.environ.get('PPE_CACHE_DIR') or None,
+    max_disk_bytes=int(os.environ.get('PPE_CACHE_MAX_DISK_BYTES', DEFAULT_MAX_DISK_BYTES))
+)
@@ -0,0 +1,228 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from detection_config import DEFAULT_CONF, DEFAULT_IOU
+from ppe_detection import load_model, load_quantized_model, list_images, QUANTIZE_MODES
+
+# Classes whose recall decides whether the INT8 model can be adopted
+VIOLATION_CLASSES = ['NO-Hardhat', 'NO-Safety Vest']
+
+def load_labels(label_path, width, height):
+    """Load YOLO-format labels as (class_id, x1, y1, x2, y2) in pixels"""
+    labels = []
+    if not os.path.exists(label_path):
+        return np.zeros((0, 5))
+
+    with open(label_path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            cls, cx, cy, w, h = int(parts[0]), *map(float, parts[1:5])
+            labels.append([
+                cls,
+                (cx - w / 2) * width, (cy - h / 2) * height,
+                (cx + w / 2) * width, (cy + h / 2) * height
+            ])
+    return np.array(labels).reshape(-1, 5)
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU between two arrays of xyxy boxes"""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)))
+
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    return intersection / (area_a[:, None] + area_b[None, :] - intersection + 1e-9)
+
+def match_predictions(predictions, labels, iou_threshold):
+    """Greedily match predictions (sorted by confidence) to labels of the same class"""
+    matched = np.zeros(len(predictions), dtype=bool)
+    if len(predictions) == 0 or len(labels) == 0:
+        return matched
+
+    order = np.argsort(-predictions[:, 1])
+    ious = box_iou(predictions[:, 2:6], labels[:, 1:5])
+    used = np.zeros(len(labels), dtype=bool)
+    for i in order:
+        candidates = (labels[:, 0] == predictions[i, 0]) & ~used & (ious[i] >= iou_threshold)
+        if candidates.any():
+            best = np.argmax(np.where(candidates, ious[i], -1))
+            used[best] = True
+            matched[i] = True
+    return matched
+
+def average_precision(confidences, matched, num_labels):
+    """Area under the interpolated precision-recall curve"""
+    if num_labels == 0 or len(confidences) == 0:
+        return 0.0
+
+    order = np.argsort(-confidences)
+    true_positives = np.cumsum(matched[order])
+    false_positives = np.cumsum(~matched[order])
+    recall = true_positives / num_labels
+    precision = true_positives / (true_positives + false_positives)
+
+    recall = np.concatenate(([0.0], recall, [1.0]))
+    precision = np.concatenate(([1.0], precision, [0.0]))
+    precision = np.flip(np.maximum.accumulate(np.flip(precision)))
+    # 101-point interpolation, as used by COCO
+    return float(np.mean(np.interp(np.linspace(0, 1, 101), recall, precision)))
+
+def run_model(model, images, conf, iou, warmup=3):
+    """Run a model over the sample on the CPU and return predictions and per-image latency"""
+    # Both models run on the CPU so the speed-up is not CUDA FP32 against CPU INT8
+    for image in images[:warmup]:
+        model(image, conf=conf, iou=iou, device='cpu', verbose=False)
+
+    predictions = []
+    latencies = []
+    for image in images:
+        start = time.perf_counter()
+        results = model(image, conf=conf, iou=iou, device='cpu', verbose=False)
+        latencies.append(time.perf_counter() - start)
+
+        boxes = results[0].boxes
+        predictions.append(np.concatenate([
+            boxes.cls.cpu().numpy().reshape(-1, 1),
+            boxes.conf.cpu().numpy().reshape(-1, 1),
+            boxes.xyxy.cpu().numpy().reshape(-1, 4)
+        ], axis=1))
+    return predictions, latencies
+
+def evaluate(predictions, labels, class_ids, recall_conf):
+    """Compute mAP@0.5, mAP@0.5:0.95 and per-class recall at the operating threshold"""
+    ap_by_threshold = []
+    for iou_threshold in np.linspace(0.5, 0.95, 10):
+        matches = [match_predictions(p, l, iou_threshold) for p, l in zip(predictions, labels)]
+        class_aps = []
+        for cls in class_ids:
+            num_labels = sum(int((l[:, 0] == cls).sum()) for l in labels)
+            if num_labels == 0:
+                continue
+            confidences = np.concatenate([p[p[:, 0] == cls, 1] for p in predictions])
+            matched = np.concatenate([m[p[:, 0] == cls] for p, m in zip(predictions, matches)])
+            class_aps.append(average_precision(confidences, matched, num_labels))
+        ap_by_threshold.append(np.mean(class_aps) if class_aps else 0.0)
+
+    # Recall at the deployed confidence threshold
+    recall = {}
+    operating = [p[p[:, 1] >= recall_conf] for p in predictions]
+    matches = [match_predictions(p, l, 0.5) for p, l in zip(operating, labels)]
+    for cls in class_ids:
+        num_labels = sum(int((l[:, 0] == cls).sum()) for l in labels)
+        true_positives = sum(int(m[p[:, 0] == cls].sum()) for p, m in zip(operating, matches))
+        recall[cls] = true_positives / num_labels if num_labels else None
+
+    return {"map50": ap_by_threshold[0], "map50_95": float(np.mean(ap_by_threshold)), "recall": recall}
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare INT8 and FP32 PPE detection on a labelled sample")
+    parser.add_argument('--data', required=True, help="Folder with images/ and labels/ (YOLO format)")
+    parser.add_argument('--mode', default='static', choices=QUANTIZE_MODES, help="Quantization mode")
+    parser.add_argument('--calibration',
+                        help="Folder of site images used to calibrate static quantization (not the evaluation images)")
+    parser.add_argument('--conf', type=float, default=DEFAULT_CONF, help="Deployed confidence threshold for recall")
+    parser.add_argument('--iou', type=float, default=DEFAULT_IOU, help="NMS IoU threshold")
+    parser.add_argument('--max-recall-drop', type=float, default=0.02,
+                        help="Largest allowed recall drop for violation classes")
+    args = parser.parse_args()
+
+    image_dir = os.path.join(args.data, 'images')
+    label_dir = os.path.join(args.data, 'labels')
+
+    # Calibrating on the evaluation images would overstate INT8 accuracy
+    if args.mode == 'static':
+        if not args.calibration:
+            parser.error("--calibration is required for static quantization")
+        if os.path.realpath(args.calibration) == os.path.realpath(image_dir):
+            parser.error("--calibration must not be the evaluation image folder")
+
+    images = []
+    labels = []
+    for path in list_images(image_dir):
+        image = cv2.imread(path)
+        if image is None:
+            print(f"Skipping unreadable image {path}")
+            continue
+        name = os.path.splitext(os.path.basename(path))[0]
+        images.append(image)
+        labels.append(load_labels(os.path.join(label_dir, f"{name}.txt"), image.shape[1], image.shape[0]))
+
+    if not images:
+        print(f"Error: No images found in {image_dir}")
+        return 1
+    print(f"Loaded {len(images)} labelled images")
+
+    # Load the FP32 model explicitly, ignoring PPE_QUANTIZE
+    fp32_model = load_model(quantize=False)
+    if fp32_model is None:
+        print("Error: Could not load the FP32 model")
+        return 1
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        # Always quantize afresh so a cached model from other calibration images is never validated
+        int8_model = load_quantized_model(fp32_model, args.mode, args.calibration,
+                                          output_path=os.path.join(output_dir, f"int8_{args.mode}.onnx"))
+        if int8_model is None:
+            print("Error: Could not load the INT8 model")
+            return 1
+        return compare_models(fp32_model, int8_model, images, labels, args)
+
+def compare_models(fp32_model, int8_model, images, labels, args):
+    """Print accuracy and speed for both models and check violation recall"""
+    names = fp32_model.names
+    class_ids = sorted(names)
+
+    # Low confidence for mAP so the full precision-recall curve is covered
+    report = {}
+    for label, model in (('FP32', fp32_model), ('INT8', int8_model)):
+        print(f"Running {label} model...")
+        predictions, latencies = run_model(model, images, conf=0.001, iou=args.iou)
+        report[label] = evaluate(predictions, labels, class_ids, args.conf)
+        report[label]["latency_ms"] = 1000 * float(np.median(latencies))
+
+    fp32, int8 = report['FP32'], report['INT8']
+    print()
+    print(f"{'':16}{'FP32':>10}{'INT8':>10}")
+    print(f"{'mAP@0.5':16}{fp32['map50']:>10.3f}{int8['map50']:>10.3f}")
+    print(f"{'mAP@0.5:0.95':16}{fp32['map50_95']:>10.3f}{int8['map50_95']:>10.3f}")
+    print(f"{'latency (ms)':16}{fp32['latency_ms']:>10.1f}{int8['latency_ms']:>10.1f}")
+    print(f"Speed-up: {fp32['latency_ms'] / int8['latency_ms']:.2f}x")
+    print()
+
+    # Adopt INT8 only if recall on violation classes holds
+    passed = any(names[cls] in VIOLATION_CLASSES for cls in class_ids)
+    if not passed:
+        print(f"Error: Model has none of the violation classes {', '.join(VIOLATION_CLASSES)}")
+    for cls in class_ids:
+        if names[cls] not in VIOLATION_CLASSES:
+            continue
+        fp32_recall, int8_recall = fp32['recall'][cls], int8['recall'][cls]
+        if fp32_recall is None:
+            print(f"{names[cls]}: no labels in sample, cannot validate")
+            passed = False
+            continue
+        drop = fp32_recall - int8_recall
+        status = "OK" if drop <= args.max_recall_drop else "FAIL"
+        print(f"{names[cls]} recall: FP32 {fp32_recall:.3f}, INT8 {int8_recall:.3f} ({status})")
+        passed = passed and status == "OK"
+
+    print()
+    print("PASS: INT8 model keeps violation recall" if passed else "FAIL: INT8 model loses violation recall")
+    return 0 if passed else 1
+
+if __name__ == "__main__":
+    sys.exit(main())